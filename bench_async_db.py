@@ -0,0 +1,106 @@
+"""
+Throughput of concurrent run_sql calls: blocking path vs thread-pool path.
+
+Before the DB tools were async, FastMCP ran them directly on its event loop,
+so N concurrent requests executed one after another. This script times the
+same workload both ways, in-process (no stdio transport involved):
+
+- blocking: the undecorated run_sql body, called on the event loop
+- async:    the run_sql tool coroutine, dispatched to the sqlite thread pool
+
+Besides throughput it reports the worst event-loop stall, i.e. how long any
+other request (or the stdio transport itself) would have been kept waiting.
+
+Usage:
+    python3 bench_async_db.py [--rows 200000] [--calls 32] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+import server
+
+QUERY = "SELECT COUNT(*), SUM(LENGTH(name)) FROM items WHERE name LIKE '%7%3%'"
+
+
+def create_db(path: str, rows: int):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.executemany(
+        "INSERT INTO items (name) VALUES (?)",
+        ((f"item-{i * 7919 % 1000003}",) for i in range(rows)),
+    )
+    conn.commit()
+    conn.close()
+
+
+async def _measure(calls: int, concurrency: int, call_once) -> tuple[float, float]:
+    """
+    Run `calls` requests, `concurrency` at a time, while a ticker coroutine
+    measures how late the event loop wakes it up (what any other MCP request
+    would wait). Returns (elapsed seconds, worst loop stall in seconds).
+    """
+    limit = asyncio.Semaphore(concurrency)
+    done = asyncio.Event()
+    worst_stall = 0.0
+
+    async def ticker():
+        nonlocal worst_stall
+        while not done.is_set():
+            before = time.perf_counter()
+            await asyncio.sleep(0.005)
+            worst_stall = max(worst_stall, time.perf_counter() - before - 0.005)
+
+    async def one():
+        async with limit:
+            await call_once()
+
+    tick = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(calls)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await tick
+    return elapsed, worst_stall
+
+
+async def run_blocking(db_path: str, calls: int, concurrency: int):
+    # What FastMCP did with a sync tool: call it right on the event loop
+    async def call_once():
+        server.run_sql.__wrapped__("sqlite", db_path, QUERY, use_cache=False)
+    return await _measure(calls, concurrency, call_once)
+
+
+async def run_async(db_path: str, calls: int, concurrency: int):
+    async def call_once():
+        await server.run_sql("sqlite", db_path, QUERY, use_cache=False)
+    return await _measure(calls, concurrency, call_once)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--calls", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.sqlite")
+        create_db(db_path, args.rows)
+        # Warm up the connection pool and the page cache
+        asyncio.run(run_blocking(db_path, 1, 1))
+
+        blocking, blocking_stall = asyncio.run(run_blocking(db_path, args.calls, args.concurrency))
+        concurrent, async_stall = asyncio.run(run_async(db_path, args.calls, args.concurrency))
+
+    print(f"{args.calls} x run_sql over {args.rows} rows, concurrency {args.concurrency}")
+    print(f"blocking: {blocking:.3f}s  {args.calls / blocking:7.1f} calls/s  worst loop stall {blocking_stall * 1000:7.1f} ms")
+    print(f"async:    {concurrent:.3f}s  {args.calls / concurrent:7.1f} calls/s  worst loop stall {async_stall * 1000:7.1f} ms")
+    print(f"speedup:  {blocking / concurrent:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Cold start to first `list_tables`, per session.
+
+Each client session normally spawns its own `python server.py` over stdio,
+so the interpreter start, the imports and the tool registration are paid on
+every conversation. This script measures, over several runs:
+
+- import:  `python -c "import server"` (interpreter + imports + module body)
+- stdio:   spawn server.py, initialize the session, first list_tables
+- shared:  attach to a long-lived `server.py --transport streamable-http`
+           (started by this script), initialize, first list_tables
+
+and exits non-zero if the median stdio cold start exceeds --target-ms.
+
+Usage:
+    python3 bench_startup.py [--runs 10] [--target-ms 2000] [--output startup.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from mcp import ClientSession
+
+from server_connection import connect_server
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+
+
+async def _first_list_tables(url: str, db_path: str) -> Dict[str, float]:
+    start = time.perf_counter()
+    async with connect_server(SERVER_SCRIPT, url) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            initialized = time.perf_counter()
+            result = await session.call_tool(
+                "list_tables", arguments={"db_type": "sqlite", "connection_string": db_path}
+            )
+            done = time.perf_counter()
+    if getattr(result, "isError", False):
+        raise RuntimeError(f"list_tables failed: {result.content}")
+    return {"initialize_ms": (initialized - start) * 1000, "first_list_tables_ms": (done - start) * 1000}
+
+
+def _import_ms() -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", "import server"],
+        cwd=os.path.dirname(SERVER_SCRIPT),
+        check=True,
+    )
+    return (time.perf_counter() - start) * 1000
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    return {
+        "min_ms": round(min(samples), 1),
+        "median_ms": round(statistics.median(samples), 1),
+        "max_ms": round(max(samples), 1),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_shared_server(port: int) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, "--transport", "streamable-http", "--port", str(port)],
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("shared server did not start listening within 30s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--target-ms", type=float, default=2000, help="Median stdio cold start budget")
+    parser.add_argument("--no-shared", action="store_true", help="Skip the shared-server measurement")
+    parser.add_argument("--output", default="", help="Also write the results as JSON here")
+    args = parser.parse_args()
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "startup.sqlite")
+        import sqlite3
+
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.close()
+
+        _import_ms()  # fill the OS file cache and __pycache__ first
+        report["import"] = _summary([_import_ms() for _ in range(args.runs)])
+
+        runs = [asyncio.run(_first_list_tables("", db_path)) for _ in range(args.runs)]
+        report["stdio"] = {
+            "initialize": _summary([r["initialize_ms"] for r in runs]),
+            "first_list_tables": _summary([r["first_list_tables_ms"] for r in runs]),
+        }
+
+        if not args.no_shared:
+            port = _free_port()
+            server = _start_shared_server(port)
+            try:
+                url = f"http://127.0.0.1:{port}/mcp"
+                runs = [asyncio.run(_first_list_tables(url, db_path)) for _ in range(args.runs)]
+            finally:
+                server.terminate()
+                server.wait()
+            report["shared"] = {
+                "initialize": _summary([r["initialize_ms"] for r in runs]),
+                "first_list_tables": _summary([r["first_list_tables_ms"] for r in runs]),
+            }
+
+    print(f"{args.runs} runs each (min / median / max, ms)")
+    print(f"import server:               {report['import']['min_ms']:>8} {report['import']['median_ms']:>8} {report['import']['max_ms']:>8}")
+    for mode in ("stdio", "shared"):
+        if mode in report:
+            s = report[mode]["first_list_tables"]
+            print(f"{mode + ' to first list_tables:':<28} {s['min_ms']:>8} {s['median_ms']:>8} {s['max_ms']:>8}")
+
+    cold = report["stdio"]["first_list_tables"]["median_ms"]
+    report["target_ms"] = args.target_ms
+    report["within_target"] = cold <= args.target_ms
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if not report["within_target"]:
+        print(f"Median stdio cold start {cold} ms exceeds the {args.target_ms:g} ms target")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
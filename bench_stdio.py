@@ -0,0 +1,207 @@
+"""
+End-to-end benchmark of the MCP server tools over stdio.
+
+Starts server.py with `stdio_client`, the same way the clients do, so every
+number includes the JSON-RPC round trip through the transport. For each
+database size it builds a SQLite file with create_dummy_dbs.create_sized_db
+and, at each concurrency level, times these workloads:
+
+- list_tables
+- run_sql_lookup: primary-key lookups with random ids
+- run_sql_scan:   a filtered scan of the orders table (result cache off)
+- run_sql_write:  single-row inserts
+- run_python:     a small computation on the warm worker pool
+
+It reports p50/p99/mean latency, throughput and error counts per workload,
+and writes the same data as JSON for comparing versions. With --baseline,
+it prints the change against an earlier results file and exits non-zero if a
+workload's p50 regressed by more than --threshold.
+
+Usage:
+    python3 bench_stdio.py [--sizes 1000,100000] [--concurrency 1,4,16] [--calls 100]
+                           [--output bench_results.json] [--baseline old.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+from create_dummy_dbs import create_sized_db
+from metrics import percentile
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+WORKLOADS = ["list_tables", "run_sql_lookup", "run_sql_scan", "run_sql_write", "run_python"]
+
+
+def _workload(name: str, db_path: str, rows: int) -> Callable[[int], Tuple[str, Dict[str, Any]]]:
+    """Returns a function mapping a call number to (tool name, arguments)."""
+    db = {"db_type": "sqlite", "connection_string": db_path}
+    rng = random.Random(42)
+    if name == "list_tables":
+        return lambda i: ("list_tables", db)
+    if name == "run_sql_lookup":
+        return lambda i: ("run_sql", {
+            **db,
+            "query": "SELECT id, name, email FROM users WHERE id = ?",
+            "params": [rng.randint(1, rows)],
+        })
+    if name == "run_sql_scan":
+        return lambda i: ("run_sql", {
+            **db,
+            "query": "SELECT id, user_id, amount FROM orders WHERE amount > ? ORDER BY amount DESC LIMIT 1000",
+            "params": [rng.randint(0, 50)],
+            "output_format": "json",
+            "use_cache": False,
+        })
+    if name == "run_sql_write":
+        return lambda i: ("run_sql", {
+            **db,
+            "query": "INSERT INTO orders (user_id, product_id, quantity, amount) VALUES (?, ?, ?, ?)",
+            "params": [rng.randint(1, rows), 1, 1, 9.99],
+        })
+    if name == "run_python":
+        return lambda i: ("run_python", {"code": f"print(sum(range({10_000 + i})))"})
+    raise ValueError(f"Unknown workload: {name}")
+
+
+async def _measure(session: ClientSession, make_call, calls: int, concurrency: int) -> Dict[str, Any]:
+    limit = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        name, arguments = make_call(i)
+        async with limit:
+            start = time.perf_counter()
+            try:
+                result = await session.call_tool(name, arguments=arguments)
+                texts = [getattr(item, "text", "") for item in result.content]
+                if getattr(result, "isError", False) or (texts and texts[0].startswith("Error")):
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    elapsed = time.perf_counter() - start
+    return {
+        "calls": calls,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "throughput": round(calls / elapsed, 2),
+    }
+
+
+async def run_benchmarks(sizes: List[int], levels: List[int], calls: int, workloads: List[str]) -> List[Dict[str, Any]]:
+    results = []
+    server_params = StdioServerParameters(command=sys.executable, args=[SERVER_SCRIPT], env=None)
+    with tempfile.TemporaryDirectory() as tmp:
+        async with stdio_client(server_params) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                for rows in sizes:
+                    db_path = os.path.join(tmp, f"bench_{rows}.sqlite")
+                    create_sized_db(db_path, rows)
+                    for workload in workloads:
+                        make_call = _workload(workload, db_path, rows)
+                        # Warm up: pool connection, schema cache, python workers
+                        await _measure(session, make_call, min(calls, 4), 1)
+                        for concurrency in levels:
+                            stats = await _measure(session, make_call, calls, concurrency)
+                            results.append({"rows": rows, "workload": workload, "concurrency": concurrency, **stats})
+                            print(
+                                f"rows={rows:<8} {workload:<15} c={concurrency:<3} "
+                                f"p50 {stats['p50_ms']:>9.2f} ms  p99 {stats['p99_ms']:>9.2f} ms  "
+                                f"{stats['throughput']:>8.1f} calls/s  errors {stats['errors']}",
+                                flush=True,
+                            )
+    return results
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(SERVER_SCRIPT),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, threshold: float) -> bool:
+    """Print p50 changes against a baseline file. Returns True if anything regressed."""
+    with open(baseline_path) as f:
+        baseline = {
+            (r["rows"], r["workload"], r["concurrency"]): r for r in json.load(f)["results"]
+        }
+    regressed = False
+    print(f"\nAgainst {baseline_path} (regression threshold {threshold:.0%}):")
+    for r in results:
+        old = baseline.get((r["rows"], r["workload"], r["concurrency"]))
+        if not old or not old["p50_ms"]:
+            continue
+        change = r["p50_ms"] / old["p50_ms"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(
+            f"rows={r['rows']:<8} {r['workload']:<15} c={r['concurrency']:<3} "
+            f"p50 {old['p50_ms']:>9.2f} -> {r['p50_ms']:>9.2f} ms ({change:+.0%}){flag}"
+        )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="1000,100000", help="Comma-separated user row counts")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--calls", type=int, default=100, help="Calls per workload and level")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS))
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default="", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed p50 slowdown, e.g. 0.2 = 20%%")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    levels = [int(c) for c in args.concurrency.split(",")]
+    workloads = args.workloads.split(",")
+    results = asyncio.run(run_benchmarks(sizes, levels, args.calls, workloads))
+
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "calls": args.calls,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline and compare(results, args.baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
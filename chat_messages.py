@@ -0,0 +1,14 @@
+"""
+Helpers for chat `messages` entries shared by the agent clients' modules.
+
+The history holds plain dicts, except that client_v4 appends the SDK's
+response message object as is.
+"""
+from typing import Any, Dict
+
+
+def as_dict(message: Any) -> Dict[str, Any]:
+    """The message as a chat-format dict (SDK objects are dumped)."""
+    if isinstance(message, dict):
+        return message
+    return message.model_dump(exclude_none=True)
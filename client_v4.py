@@ -1,23 +1,45 @@
 import asyncio
 import json
 import os
-import sys
 from typing import Any, Dict, List
 
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from mcp import ClientSession
 from openai import OpenAI
 
+from history_compactor import HistoryCompactor
+from observations import READ_OBSERVATION_TOOL, ObservationStore
+from server_connection import connect_server
+from transcript import TranscriptWriter, load_transcript
+
 # Configuration
 SERVER_SCRIPT = (
     "/Users/yonh/.gemini/antigravity/playground/crystal-quasar/db_compare_mcp/server.py"
 )
 DB1_PATH = "/Users/yonh/.gemini/antigravity/playground/crystal-quasar/db_compare_mcp/test_db_1.sqlite"
 DB2_PATH = "/Users/yonh/.gemini/antigravity/playground/crystal-quasar/db_compare_mcp/test_db_2.sqlite"
+# Attach to a shared server (python server.py --transport streamable-http)
+# instead of spawning one per session, e.g. http://127.0.0.1:8000/mcp
+MCP_SERVER_URL = os.environ.get("MCP_SERVER_URL", "")
 
 # Initialize OpenAI Client
 client = OpenAI()
 MODEL_NAME = "gpt-4o"
+# Max tool calls from one assistant turn that run at the same time
+MAX_PARALLEL_TOOL_CALLS = int(os.environ.get("MAX_PARALLEL_TOOL_CALLS", "4"))
+# Token budget for the history re-sent on every LLM call (older tool outputs
+# are elided first); the last HISTORY_KEEP_RECENT_TURNS turns stay verbatim
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "32000"))
+HISTORY_KEEP_RECENT_TURNS = int(os.environ.get("HISTORY_KEEP_RECENT_TURNS", "2"))
+# Tool results longer than this are spilled to OBSERVATION_DIR and replaced by a
+# summary the model can page through with the read_observation tool
+OBSERVATION_MAX_CHARS = int(os.environ.get("OBSERVATION_MAX_CHARS", "4000"))
+OBSERVATION_DIR = os.environ.get("OBSERVATION_DIR", ".observations")
+observation_store = ObservationStore(OBSERVATION_DIR, OBSERVATION_MAX_CHARS)
+# Every message is appended to TRANSCRIPT_DIR/<session>.<segment>.jsonl as it is
+# added; set TRANSCRIPT_SESSION to an existing session id to resume it
+TRANSCRIPT_DIR = os.environ.get("TRANSCRIPT_DIR", ".transcripts")
+TRANSCRIPT_SESSION = os.environ.get("TRANSCRIPT_SESSION", "")
+TRANSCRIPT_MAX_BYTES = int(os.environ.get("TRANSCRIPT_MAX_BYTES", str(8 * 1024 * 1024)))
 
 print(f"--- OpenAI Client Configuration ---")
 print(f"Base URL: {client.base_url}")
@@ -54,13 +76,30 @@ def print_colored(text: str, color: str, end: str = "\n"):
     print(f"{color}{text}{Colors.ENDC}", end=end)
 
 
-async def run_agent_loop():
-    # 1. Start MCP Server
-    server_params = StdioServerParameters(
-        command=sys.executable, args=[SERVER_SCRIPT], env=None
-    )
+async def call_tool(
+    session: ClientSession, tool_call: Any, semaphore: asyncio.Semaphore
+) -> str:
+    """Executes one tool call via MCP and returns its output as text."""
+    async with semaphore:
+        try:
+            tool_name = tool_call.function.name
+            tool_args = json.loads(tool_call.function.arguments)
+            if tool_name == "read_observation":
+                return observation_store.read(**tool_args)
+            result = await session.call_tool(tool_name, arguments=tool_args)
+            # A single text item (e.g. run_sql output, including its
+            # JSON formats) is passed through as-is, not re-wrapped
+            # in a Python list repr.
+            texts = [item.text for item in result.content]
+            tool_output_text = texts[0] if len(texts) == 1 else str(texts)
+        except Exception as e:
+            return f"Error: {str(e)}"
+        return observation_store.shape(tool_name, tool_output_text)
 
-    async with stdio_client(server_params) as (read, write):
+
+async def run_agent_loop():
+    # 1. Start MCP Server (or attach to a shared one)
+    async with connect_server(SERVER_SCRIPT, MCP_SERVER_URL) as (read, write):
         async with ClientSession(read, write) as session:
             await session.initialize()
 
@@ -72,6 +111,8 @@ async def run_agent_loop():
 
             # Convert to OpenAI Format
             openai_tools = [mcp_tool_to_openai_tool(t) for t in mcp_tools]
+            # Client-side tool for paging through spilled observations
+            openai_tools.append(READ_OBSERVATION_TOOL)
             print(
                 f"Loaded {len(openai_tools)} tools: {[t['function']['name'] for t in openai_tools]}"
             )
@@ -121,9 +162,32 @@ async def run_agent_loop():
                 }
             ]
 
+            transcript = TranscriptWriter(
+                TRANSCRIPT_DIR, TRANSCRIPT_SESSION or None, TRANSCRIPT_MAX_BYTES
+            )
+            if TRANSCRIPT_SESSION:
+                # Keep the current system prompt, restore the conversation after it
+                restored = load_transcript(TRANSCRIPT_DIR, TRANSCRIPT_SESSION)
+                messages.extend(m for m in restored if m.get("role") != "system")
+                print_colored(
+                    f"Resumed session {TRANSCRIPT_SESSION} ({len(messages) - 1} messages)",
+                    Colors.BLUE,
+                )
+            else:
+                transcript.append(messages[0])
+
+            def remember(message: Any):
+                messages.append(message)
+                transcript.append(message)
+
+            compactor = HistoryCompactor(
+                HISTORY_TOKEN_BUDGET, HISTORY_KEEP_RECENT_TURNS, model=MODEL_NAME
+            )
+
             print("\n" + "=" * 50)
             print_colored("🤖 DB Agent V4 Online (Explicit ReAct Mode)", Colors.CYAN)
             print(f"Connected to DBs:\n1. {DB1_PATH}\n2. {DB2_PATH}")
+            print(f"Transcript session: {transcript.session_id} (in {TRANSCRIPT_DIR})")
             print("Type 'exit', 'quit', or 'bye' to stop.")
             print("=" * 50 + "\n")
 
@@ -141,11 +205,19 @@ async def run_agent_loop():
                     print("Goodbye!")
                     break
 
-                messages.append({"role": "user", "content": user_input})
+                remember({"role": "user", "content": user_input})
 
                 # Agent Execution Loop (Handle Tool Calls)
                 while True:
                     # print(".", end="", flush=True) # Thinking indicator removed in favor of explicit thoughts
+                    saved = compactor.compact(messages)
+                    if saved:
+                        print_colored(
+                            f"\n[History] Compacted: saved {saved} tokens, "
+                            f"{compactor.total_tokens} tokens in context",
+                            Colors.BLUE,
+                        )
+
                     try:
                         response = client.chat.completions.create(
                             model=MODEL_NAME,
@@ -158,7 +230,7 @@ async def run_agent_loop():
                         return
 
                     response_message = response.choices[0].message
-                    messages.append(response_message)
+                    remember(response_message)
 
                     content = response_message.content
                     if content:
@@ -203,25 +275,26 @@ async def run_agent_loop():
                             print_colored(f"\nAssistant: {content}", Colors.CYAN)
 
                     if response_message.tool_calls:
+                        # Tool Calls (Magenta), all printed before any of them runs
                         for tool_call in response_message.tool_calls:
-                            tool_name = tool_call.function.name
-                            tool_args = json.loads(tool_call.function.arguments)
-
-                            # Tool Call (Magenta)
                             print_colored(
-                                f"\n[Action] {tool_name}({tool_args})", Colors.HEADER
+                                f"\n[Action] {tool_call.function.name}({tool_call.function.arguments})",
+                                Colors.HEADER,
                             )
 
-                            try:
-                                result = await session.call_tool(
-                                    tool_name, arguments=tool_args
-                                )
-                                tool_output_text = str(
-                                    [item.text for item in result.content]
-                                )
-                            except Exception as e:
-                                tool_output_text = f"Error: {str(e)}"
+                        # Independent calls from one turn run concurrently;
+                        # gather() keeps the results in the original order.
+                        semaphore = asyncio.Semaphore(MAX_PARALLEL_TOOL_CALLS)
+                        tool_outputs = await asyncio.gather(
+                            *(
+                                call_tool(session, tool_call, semaphore)
+                                for tool_call in response_message.tool_calls
+                            )
+                        )
 
+                        for tool_call, tool_output_text in zip(
+                            response_message.tool_calls, tool_outputs
+                        ):
                             # Tool Result (Green - Observation in ReAct)
                             # Truncate if too long
                             display_output = (
@@ -233,27 +306,17 @@ async def run_agent_loop():
                                 f"[Observation] {display_output}", Colors.GREEN
                             )
 
-                            messages.append(
+                            remember(
                                 {
                                     "tool_call_id": tool_call.id,
                                     "role": "tool",
-                                    "name": tool_name,
+                                    "name": tool_call.function.name,
                                     "content": tool_output_text,
                                 }
                             )
                         # Continue loop to let LLM see the tool output and decide next step
                     else:
                         # No tool calls, and we already printed the content above.
-                        # Save conversation history for debugging
-                        with open("messages.json", "w") as f:
-                            json.dump(
-                                messages,
-                                f,
-                                indent=2,
-                                default=lambda o: o.model_dump()
-                                if hasattr(o, "model_dump")
-                                else str(o),
-                            )
                         break
 
 
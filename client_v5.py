@@ -2,11 +2,17 @@ import asyncio
 import json
 import os
 import sys
-from typing import Any, Dict, List
+import time
+from typing import Any, Dict, Iterator, List, Optional
 
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
-from openai import OpenAI
+from mcp import ClientSession
+from openai import AsyncOpenAI
+
+from history_compactor import HistoryCompactor
+from observations import READ_OBSERVATION_TOOL, ObservationStore
+from server_connection import connect_server
+from replay import SessionRecorder
+from transcript import TranscriptWriter, load_transcript
 
 # Configuration
 SERVER_SCRIPT = (
@@ -14,16 +20,37 @@ SERVER_SCRIPT = (
 )
 DB1_PATH = "/Users/yonh/.gemini/antigravity/playground/crystal-quasar/db_compare_mcp/test_db_1.sqlite"
 DB2_PATH = "/Users/yonh/.gemini/antigravity/playground/crystal-quasar/db_compare_mcp/test_db_2.sqlite"
+# Attach to a shared server (python server.py --transport streamable-http)
+# instead of spawning one per session, e.g. http://127.0.0.1:8000/mcp
+MCP_SERVER_URL = os.environ.get("MCP_SERVER_URL", "")
 
-# Initialize OpenAI Client
-client = OpenAI()
 MODEL_NAME = "gpt-5.1"
-
-print(f"--- OpenAI Client Configuration ---")
-print(f"Base URL: {client.base_url}")
-print(f"API Key:  {client.api_key[:8]}..." if client.api_key else "API Key:  Not Set")
-print(f"-----------------------------------")
-
+# Max tool calls from one assistant turn that run at the same time
+MAX_PARALLEL_TOOL_CALLS = int(os.environ.get("MAX_PARALLEL_TOOL_CALLS", "4"))
+# Token budget for the history re-sent on every LLM call (older tool outputs
+# are elided first); the last HISTORY_KEEP_RECENT_TURNS turns stay verbatim
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "32000"))
+HISTORY_KEEP_RECENT_TURNS = int(os.environ.get("HISTORY_KEEP_RECENT_TURNS", "2"))
+# Tool results longer than this are spilled to OBSERVATION_DIR and replaced by a
+# summary the model can page through with the read_observation tool
+OBSERVATION_MAX_CHARS = int(os.environ.get("OBSERVATION_MAX_CHARS", "4000"))
+OBSERVATION_DIR = os.environ.get("OBSERVATION_DIR", ".observations")
+observation_store = ObservationStore(OBSERVATION_DIR, OBSERVATION_MAX_CHARS)
+# Every message is appended to TRANSCRIPT_DIR/<session>.<segment>.jsonl as it is
+# added; set TRANSCRIPT_SESSION to an existing session id to resume it
+TRANSCRIPT_DIR = os.environ.get("TRANSCRIPT_DIR", ".transcripts")
+TRANSCRIPT_SESSION = os.environ.get("TRANSCRIPT_SESSION", "")
+TRANSCRIPT_MAX_BYTES = int(os.environ.get("TRANSCRIPT_MAX_BYTES", str(8 * 1024 * 1024)))
+# Record every LLM call and tool call to this JSONL file for replay.py
+RECORD_SESSION = os.environ.get("RECORD_SESSION", "")
+# Per-request budgets for the agent loop (see docs/07_loop_control.md)
+AGENT_MAX_ITERATIONS = int(os.environ.get("AGENT_MAX_ITERATIONS", "15"))  # LLM calls
+AGENT_TIMEOUT = float(os.environ.get("AGENT_TIMEOUT", "180"))  # seconds
+AGENT_MAX_TOKENS = int(os.environ.get("AGENT_MAX_TOKENS", "200000"))  # prompt + completion
+AGENT_MAX_COST_USD = float(os.environ.get("AGENT_MAX_COST_USD", "0.50"))
+# USD per 1M tokens; adjust to the pricing of MODEL_NAME
+PRICE_INPUT_PER_MTOK = float(os.environ.get("PRICE_INPUT_PER_MTOK", "1.25"))
+PRICE_OUTPUT_PER_MTOK = float(os.environ.get("PRICE_OUTPUT_PER_MTOK", "10.00"))
 
 def mcp_tool_to_openai_tool(mcp_tool: Any) -> Dict[str, Any]:
     """Converts an MCP Tool definition to an OpenAI Tool definition."""
@@ -54,13 +81,191 @@ def print_colored(text: str, color: str, end: str = "\n"):
     print(f"{color}{text}{Colors.ENDC}", end=end)
 
 
-async def run_agent_loop():
-    # 1. Start MCP Server
-    server_params = StdioServerParameters(
-        command=sys.executable, args=[SERVER_SCRIPT], env=None
-    )
-
-    async with stdio_client(server_params) as (read, write):
+async def call_tool(
+    session: ClientSession,
+    name: str,
+    arguments: str,
+    semaphore: asyncio.Semaphore,
+    recorder: Optional[SessionRecorder] = None,
+) -> str:
+    """Executes one tool call via MCP and returns its output as text."""
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            tool_args = json.loads(arguments) if arguments else {}
+            if name == "read_observation":
+                tool_output_text = observation_store.read(**tool_args)
+            else:
+                result = await session.call_tool(name, arguments=tool_args)
+                # A single text item (e.g. run_sql output, including its
+                # JSON formats) is passed through as-is, not re-wrapped
+                # in a Python list repr.
+                texts = [item.text for item in result.content]
+                tool_output_text = observation_store.shape(
+                    name, texts[0] if len(texts) == 1 else str(texts)
+                )
+        except Exception as e:
+            tool_output_text = f"Error: {str(e)}"
+        if recorder:
+            recorder.record_tool(name, arguments, tool_output_text, time.perf_counter() - started)
+        return tool_output_text
+
+
+def arguments_complete(arguments: str) -> bool:
+    """True once a streamed tool-call argument string is a complete JSON object."""
+    if not arguments.rstrip().endswith("}"):
+        return False
+    try:
+        json.loads(arguments)
+        return True
+    except ValueError:
+        return False
+
+
+class StreamRenderer:
+    """
+    Prints streamed assistant text as it arrives.
+
+    A response starting with a "[Thought]" line prints that block in yellow
+    up to the first empty line and the rest in cyan; any other response is
+    printed in cyan after "Assistant: ".
+    """
+
+    def __init__(self):
+        self.state = "start"  # start -> thought -> answer
+        self.pending = ""
+        self.previous = ""
+
+    def _write(self, text: str, color: str):
+        sys.stdout.write(f"{color}{text}{Colors.ENDC}")
+        sys.stdout.flush()
+
+    def feed(self, text: str):
+        if self.state == "start":
+            self.pending += text
+            head = self.pending.lstrip()
+            if len(head) < len("[Thought]") and "\n" not in head:
+                return  # not enough text yet to tell the two formats apart
+            text, self.pending = self.pending, ""
+            if head.startswith("[Thought]"):
+                self.state = "thought"
+                self._write("\n", Colors.YELLOW)
+            else:
+                self.state = "answer"
+                self._write("\nAssistant: ", Colors.CYAN)
+                text = text.lstrip()
+
+        if self.state == "thought":
+            for i, char in enumerate(text):
+                if char == "\n" and self.previous == "\n":
+                    # Empty line marks end of thought
+                    self.state = "answer"
+                    self._write(text[:i], Colors.YELLOW)
+                    text = text[i:]
+                    break
+                self.previous = char
+            else:
+                self._write(text, Colors.YELLOW)
+                return
+
+        self._write(text, Colors.CYAN)
+
+    def finish(self):
+        if self.pending:
+            self.state = "answer"
+            self._write(f"\nAssistant: {self.pending.strip()}", Colors.CYAN)
+            self.pending = ""
+        if self.state != "start":
+            print()
+
+
+class LoopBudget:
+    """
+    Iteration, wall-clock, token and cost limits for answering one user
+    request. Usage is taken from the `usage` the API reports for each call.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.iterations = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.actions: List[str] = []
+        self.last_observation = ""
+
+    def record_usage(self, usage: Any):
+        self.prompt_tokens += usage.prompt_tokens or 0
+        self.completion_tokens += usage.completion_tokens or 0
+
+    @property
+    def cost(self) -> float:
+        return (
+            self.prompt_tokens * PRICE_INPUT_PER_MTOK
+            + self.completion_tokens * PRICE_OUTPUT_PER_MTOK
+        ) / 1_000_000
+
+    def remaining_time(self) -> float:
+        return max(AGENT_TIMEOUT - (time.monotonic() - self.started), 0.0)
+
+    def exceeded(self) -> str:
+        """Reason the loop must stop now, or an empty string."""
+        if self.iterations >= AGENT_MAX_ITERATIONS:
+            return f"reached {AGENT_MAX_ITERATIONS} iterations"
+        if self.remaining_time() <= 0:
+            return f"exceeded {AGENT_TIMEOUT:g}s time limit"
+        if self.prompt_tokens + self.completion_tokens >= AGENT_MAX_TOKENS:
+            return f"used {self.prompt_tokens + self.completion_tokens} of {AGENT_MAX_TOKENS} tokens"
+        if self.cost >= AGENT_MAX_COST_USD:
+            return f"spent ${self.cost:.4f} of ${AGENT_MAX_COST_USD:.2f} budget"
+        return ""
+
+    def usage_line(self) -> str:
+        return (
+            f"[Usage] {self.iterations} LLM calls, "
+            f"{self.prompt_tokens} prompt + {self.completion_tokens} completion tokens, "
+            f"${self.cost:.4f}, {time.monotonic() - self.started:.1f}s"
+        )
+
+    def partial_summary(self, reason: str) -> str:
+        """What was done before the budget ran out, kept in history as the answer."""
+        counts: Dict[str, int] = {}
+        for name in self.actions:
+            counts[name] = counts.get(name, 0) + 1
+        done = ", ".join(f"{name} x{n}" for name, n in counts.items()) or "none"
+        summary = f"Stopped early: {reason}.\nTools called so far: {done}."
+        if self.last_observation:
+            summary += f"\nLast observation: {self.last_observation[:500]}"
+        return summary
+
+
+async def run_agent_loop(
+    llm: Optional[Any] = None,
+    inputs: Optional[Iterator[str]] = None,
+    recorder: Optional[SessionRecorder] = None,
+    server_script: str = SERVER_SCRIPT,
+):
+    """
+    Interactive agent session.
+
+    Args:
+        llm: Chat completions client (default: a new AsyncOpenAI client);
+            replay.py passes a stub that plays back a recording
+        inputs: User inputs to use instead of reading stdin
+        recorder: Records LLM and tool calls (default: RECORD_SESSION, if set)
+        server_script: server.py to spawn when MCP_SERVER_URL is not set
+    """
+    if llm is None:
+        # Created here, not at import, so replay.py runs without an API key
+        llm = AsyncOpenAI()
+        print(f"--- OpenAI Client Configuration ---")
+        print(f"Base URL: {llm.base_url}")
+        print(f"API Key:  {llm.api_key[:8]}..." if llm.api_key else "API Key:  Not Set")
+        print(f"-----------------------------------")
+    if recorder is None and RECORD_SESSION:
+        recorder = SessionRecorder(RECORD_SESSION)
+
+    # 1. Start MCP Server (or attach to a shared one)
+    async with connect_server(server_script, MCP_SERVER_URL) as (read, write):
         async with ClientSession(read, write) as session:
             await session.initialize()
 
@@ -72,6 +277,8 @@ async def run_agent_loop():
 
             # Convert to OpenAI Format
             openai_tools = [mcp_tool_to_openai_tool(t) for t in mcp_tools]
+            # Client-side tool for paging through spilled observations
+            openai_tools.append(READ_OBSERVATION_TOOL)
             print(
                 f"Loaded {len(openai_tools)} tools: {[t['function']['name'] for t in openai_tools]}"
             )
@@ -93,8 +300,16 @@ async def run_agent_loop():
                         "\n"
                         "2. run_sql(db_type, connection_string, query) - Execute SQL on SQLite or MySQL\n"
                         "   - Use the same connection_string format as list_tables\n"
+                        "   - Pass output_format='json' for columnar JSON (columns, types, data per column)\n"
+                        "   - Pass values via params instead of inlining literals, e.g.\n"
+                        "     run_sql('sqlite', path, 'SELECT * FROM users WHERE id = ?', params=[42])\n"
                         "\n"
+                        "   - Prefer describe_schema(db_type, connection_string) to inspect columns/indexes of all tables at once\n"
+                        "   - Use run_sql_batch(db_type, connection_string, statements=[...]) to run several statements\n"
+                        "     in one transaction, or query + params (many rows) for bulk inserts\n"
                         "3. run_python(code) - Execute Python code for calculations, data processing, web scraping, etc.\n"
+                        "   - Pass session_id (e.g. 'analysis') to keep imports and variables between calls;\n"
+                        "     use reset_python_session / close_python_session when done\n"
                         "\n"
                         "# DATABASE SUPPORT:\n"
                         "You can work with both SQLite and MySQL databases.\n"
@@ -137,16 +352,46 @@ async def run_agent_loop():
                 }
             ]
 
+            transcript = TranscriptWriter(
+                TRANSCRIPT_DIR, TRANSCRIPT_SESSION or None, TRANSCRIPT_MAX_BYTES
+            )
+            if TRANSCRIPT_SESSION:
+                # Keep the current system prompt, restore the conversation after it
+                restored = load_transcript(TRANSCRIPT_DIR, TRANSCRIPT_SESSION)
+                messages.extend(m for m in restored if m.get("role") != "system")
+                print_colored(
+                    f"Resumed session {TRANSCRIPT_SESSION} ({len(messages) - 1} messages)",
+                    Colors.BLUE,
+                )
+            else:
+                transcript.append(messages[0])
+
+            def remember(message: Any):
+                messages.append(message)
+                transcript.append(message)
+
+            compactor = HistoryCompactor(
+                HISTORY_TOKEN_BUDGET, HISTORY_KEEP_RECENT_TURNS, model=MODEL_NAME
+            )
+
             print("\n" + "=" * 50)
             print_colored("🤖 DB Agent V5 Online (Code Execution Mode)", Colors.CYAN)
             print(f"Connected to DBs:\n1. {DB1_PATH}\n2. {DB2_PATH}")
+            print(f"Transcript session: {transcript.session_id} (in {TRANSCRIPT_DIR})")
             print("Type 'exit', 'quit', or 'bye' to stop.")
             print("=" * 50 + "\n")
 
             while True:
                 try:
                     # User Input (Green)
-                    user_input = input(f"{Colors.GREEN}User: {Colors.ENDC}").strip()
+                    prompt = f"{Colors.GREEN}User: {Colors.ENDC}"
+                    if inputs is None:
+                        user_input = input(prompt).strip()
+                    else:
+                        user_input = next(inputs, None)
+                        if user_input is None:
+                            raise EOFError
+                        print(prompt + user_input)
                 except EOFError:
                     break
 
@@ -157,86 +402,159 @@ async def run_agent_loop():
                     print("Goodbye!")
                     break
 
-                messages.append({"role": "user", "content": user_input})
+                remember({"role": "user", "content": user_input})
+                if recorder:
+                    recorder.record_user(user_input)
 
                 # Agent Execution Loop (Handle Tool Calls)
+                budget = LoopBudget()
                 while True:
-                    # print(".", end="", flush=True) # Thinking indicator removed in favor of explicit thoughts
-                    try:
-                        response = client.chat.completions.create(
+                    reason = budget.exceeded()
+                    if reason:
+                        summary = budget.partial_summary(reason)
+                        print_colored(f"\n{summary}", Colors.RED)
+                        remember({"role": "assistant", "content": summary})
+                        break
+
+                    saved = compactor.compact(messages)
+                    if saved:
+                        print_colored(
+                            f"\n[History] Compacted: saved {saved} tokens, "
+                            f"{compactor.total_tokens} tokens in context",
+                            Colors.BLUE,
+                        )
+
+                    # Stream the response: text is rendered as it arrives and each
+                    # tool call starts as soon as its arguments are complete.
+                    renderer = StreamRenderer()
+                    semaphore = asyncio.Semaphore(MAX_PARALLEL_TOOL_CALLS)
+                    content_parts = []
+                    tool_calls = {}  # stream index -> {"id", "name", "arguments"}
+                    tool_tasks = {}  # stream index -> asyncio.Task
+
+                    def start_tool_call(index: int):
+                        call = tool_calls[index]
+                        # Tool Call (Magenta)
+                        print_colored(
+                            f"\n[Action] {call['name']}({call['arguments']})",
+                            Colors.HEADER,
+                        )
+                        tool_tasks[index] = asyncio.create_task(
+                            call_tool(
+                                session, call["name"], call["arguments"], semaphore, recorder
+                            )
+                        )
+                        budget.actions.append(call["name"])
+
+                    budget.iterations += 1
+                    timed_out = False
+                    usage = None
+                    stream = None
+
+                    async def stream_reply():
+                        nonlocal stream, usage
+                        stream = await llm.chat.completions.create(
                             model=MODEL_NAME,
                             messages=messages,
                             tools=openai_tools,
                             tool_choice="auto",
+                            stream=True,
+                            stream_options={"include_usage": True},
                         )
+                        async for chunk in stream:
+                            if chunk.usage:
+                                usage = chunk.usage
+                                budget.record_usage(usage)
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta
+                            if delta.content:
+                                content_parts.append(delta.content)
+                                renderer.feed(delta.content)
+                            for tc in delta.tool_calls or []:
+                                call = tool_calls.setdefault(
+                                    tc.index, {"id": "", "name": "", "arguments": ""}
+                                )
+                                if tc.id:
+                                    call["id"] = tc.id
+                                if tc.function and tc.function.name:
+                                    call["name"] += tc.function.name
+                                if tc.function and tc.function.arguments:
+                                    call["arguments"] += tc.function.arguments
+                                if tc.index not in tool_tasks and arguments_complete(
+                                    call["arguments"]
+                                ):
+                                    start_tool_call(tc.index)
+
+                    llm_started = time.perf_counter()
+                    try:
+                        # Bounds a stalled request or stream too, not just
+                        # the time between chunks
+                        await asyncio.wait_for(stream_reply(), timeout=budget.remaining_time())
+                    except asyncio.TimeoutError:
+                        timed_out = True
+                        if stream is not None:
+                            await stream.close()
                     except Exception as e:
+                        for task in tool_tasks.values():
+                            task.cancel()
+                        if stream is not None:
+                            await stream.close()
                         print_colored(f"\nError calling LLM: {e}", Colors.RED)
                         return
+                    renderer.finish()
 
-                    response_message = response.choices[0].message
-                    messages.append(response_message)
-
-                    content = response_message.content
-                    if content:
-                        # Check if it contains a thought
-                        if "[Thought]" in content:
-                            # Split by double newline or look for pattern
-                            # Expected format: "[Thought]\nReasoning here...\n\nActual response"
-                            lines = content.split("\n")
-                            thought_lines = []
-                            response_lines = []
-                            in_thought = False
-                            thought_ended = False
-
-                            for line in lines:
-                                if line.strip() == "[Thought]":
-                                    in_thought = True
-                                    thought_lines.append(line)
-                                elif in_thought and not thought_ended:
-                                    if line.strip() == "":
-                                        # Empty line marks end of thought
-                                        thought_ended = True
-                                    else:
-                                        thought_lines.append(line)
-                                else:
-                                    response_lines.append(line)
-
-                            # Print Thought in Yellow
-                            if thought_lines:
-                                print_colored(
-                                    f"\n{chr(10).join(thought_lines)}", Colors.YELLOW
-                                )
-
-                            # Print the rest (if any) in Cyan
-                            if response_lines and any(
-                                line.strip() for line in response_lines
-                            ):
-                                print_colored(
-                                    f"\n{chr(10).join(response_lines).strip()}",
-                                    Colors.CYAN,
-                                )
-                        else:
-                            print_colored(f"\nAssistant: {content}", Colors.CYAN)
-
-                    if response_message.tool_calls:
-                        for tool_call in response_message.tool_calls:
-                            tool_name = tool_call.function.name
-                            tool_args = json.loads(tool_call.function.arguments)
-
-                            # Tool Call (Magenta)
-                            print_colored(
-                                f"\n[Action] {tool_name}({tool_args})", Colors.HEADER
-                            )
-
+                    if timed_out:
+                        # Calls still being streamed are dropped, started ones are kept
+                        tool_calls = {i: c for i, c in tool_calls.items() if i in tool_tasks}
+                    else:
+                        # Calls whose arguments never parsed early (e.g. empty) start now
+                        for index in sorted(tool_calls):
+                            if index not in tool_tasks:
+                                start_tool_call(index)
+
+                    ordered = [tool_calls[index] for index in sorted(tool_calls)]
+                    content = "".join(content_parts)
+                    assistant_message = {"role": "assistant", "content": content or None}
+                    if ordered:
+                        assistant_message["tool_calls"] = [
+                            {
+                                "id": call["id"],
+                                "type": "function",
+                                "function": {
+                                    "name": call["name"],
+                                    "arguments": call["arguments"],
+                                },
+                            }
+                            for call in ordered
+                        ]
+                    if recorder:
+                        recorder.record_llm(
+                            messages,
+                            assistant_message,
+                            usage,
+                            time.perf_counter() - llm_started,
+                        )
+                    if timed_out and not ordered:
+                        # The reply was cut off: keep what arrived, plus the summary
+                        reason = budget.exceeded() or f"exceeded {AGENT_TIMEOUT:g}s time limit"
+                        summary = budget.partial_summary(reason)
+                        print_colored(f"\n{summary}", Colors.RED)
+                        assistant_message = {
+                            "role": "assistant",
+                            "content": f"{content}\n\n{summary}" if content else summary,
+                        }
+                    remember(assistant_message)
+
+                    if ordered:
+                        for index, call in zip(sorted(tool_calls), ordered):
                             try:
-                                result = await session.call_tool(
-                                    tool_name, arguments=tool_args
-                                )
-                                tool_output_text = str(
-                                    [item.text for item in result.content]
+                                tool_output_text = await asyncio.wait_for(
+                                    tool_tasks[index], timeout=budget.remaining_time()
                                 )
-                            except Exception as e:
-                                tool_output_text = f"Error: {str(e)}"
+                            except asyncio.TimeoutError:
+                                tool_output_text = "Error: cancelled, the agent's time budget ran out"
+                            budget.last_observation = tool_output_text
 
                             # Tool Result (Green - Observation in ReAct)
                             # Truncate if too long
@@ -249,29 +567,21 @@ async def run_agent_loop():
                                 f"[Observation] {display_output}", Colors.GREEN
                             )
 
-                            messages.append(
+                            remember(
                                 {
-                                    "tool_call_id": tool_call.id,
+                                    "tool_call_id": call["id"],
                                     "role": "tool",
-                                    "name": tool_name,
+                                    "name": call["name"],
                                     "content": tool_output_text,
                                 }
                             )
                         # Continue loop to let LLM see the tool output and decide next step
                     else:
                         # No tool calls, and we already printed the content above.
-                        # Save conversation history for debugging
-                        with open("messages.json", "w") as f:
-                            json.dump(
-                                messages,
-                                f,
-                                indent=2,
-                                default=lambda o: o.model_dump()
-                                if hasattr(o, "model_dump")
-                                else str(o),
-                            )
                         break
 
+                print_colored(budget.usage_line(), Colors.BLUE)
+
 
 if __name__ == "__main__":
     try:
@@ -16,6 +16,40 @@ def create_db(path, tables):
     conn.close()
     print(f"Created database at {path} with tables: {tables}")
 
+def create_sized_db(path, rows):
+    """
+    Same schema idea as create_db, but filled with data: `rows` users,
+    rows // 10 products and rows * 5 orders. Used by bench_stdio.py.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, email TEXT)")
+    cursor.execute("CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, price REAL)")
+    cursor.execute(
+        "CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INTEGER, "
+        "product_id INTEGER, quantity INTEGER, amount REAL)"
+    )
+    products = max(rows // 10, 1)
+    cursor.executemany(
+        "INSERT INTO users (id, name, email) VALUES (?, ?, ?)",
+        ((i, f"user-{i}", f"user-{i}@example.com") for i in range(1, rows + 1)),
+    )
+    cursor.executemany(
+        "INSERT INTO products (id, name, price) VALUES (?, ?, ?)",
+        ((i, f"product-{i}", (i * 37 % 1000) / 10) for i in range(1, products + 1)),
+    )
+    cursor.executemany(
+        "INSERT INTO orders (user_id, product_id, quantity, amount) VALUES (?, ?, ?, ?)",
+        (
+            (i * 7919 % rows + 1, i * 104729 % products + 1, i % 5 + 1, (i * 13 % 10000) / 100)
+            for i in range(rows * 5)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
 if __name__ == "__main__":
     # DB 1 has 'users', 'products', 'orders'
     create_db(DB1_PATH, ["users", "products", "orders"])
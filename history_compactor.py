@@ -0,0 +1,138 @@
+"""
+Token-aware compaction of the agent's `messages` history.
+
+The clients keep appending to `messages` and re-send all of it on every LLM
+call. `HistoryCompactor.compact(messages)` keeps the history under a token
+budget, in place, before each call:
+
+1. Old tool outputs (e.g. full `run_sql` dumps) are cut to a short head plus
+   an elision note.
+2. If that is not enough, long old assistant texts are cut the same way.
+3. If still over budget, the oldest whole turns (a user message and
+   everything up to the next one) are dropped.
+
+The system prompt and the most recent turns are never touched, and a tool
+message is never separated from the assistant message that called it.
+Token counts are cached per message, so each call only counts new or changed
+messages instead of the whole history.
+"""
+from typing import Any, List
+
+from chat_messages import as_dict
+
+# Try to use the real tokenizer, but don't fail if not available
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+MESSAGE_OVERHEAD = 4  # per-message framing tokens in the chat format
+ELIDED_HEAD_CHARS = 300
+
+
+def _field(message: Any, name: str):
+    if isinstance(message, dict):
+        return message.get(name)
+    return getattr(message, name, None)
+
+
+class HistoryCompactor:
+    def __init__(self, max_tokens: int, keep_recent_turns: int = 2, model: str = "gpt-4o"):
+        self.max_tokens = max_tokens
+        self.keep_recent_turns = keep_recent_turns
+        self.total_tokens = 0
+        self.tokens_saved = 0
+        self._counts: List[int] = []  # token count per message, by position
+        self._encoding = None
+        if TIKTOKEN_AVAILABLE:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("o200k_base")
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(text) // 4 + 1  # rough estimate without tiktoken
+
+    def count_message(self, message: Any) -> int:
+        tokens = MESSAGE_OVERHEAD + self.count_text(_field(message, "content") or "")
+        for call in _field(message, "tool_calls") or []:
+            function = _field(call, "function")
+            tokens += self.count_text(_field(function, "name") or "")
+            tokens += self.count_text(_field(function, "arguments") or "")
+        return tokens
+
+    def _sync_counts(self, messages: List[Any]):
+        # Only messages appended since the last call are counted
+        if len(self._counts) > len(messages):
+            self._counts = self._counts[: len(messages)]
+        for message in messages[len(self._counts):]:
+            self._counts.append(self.count_message(message))
+        self.total_tokens = sum(self._counts)
+
+    def _protected_start(self, messages: List[Any]) -> int:
+        """Index of the first message belonging to the most recent turns."""
+        user_indexes = [i for i, m in enumerate(messages) if _field(m, "role") == "user"]
+        if len(user_indexes) < self.keep_recent_turns or self.keep_recent_turns <= 0:
+            return 1 if self.keep_recent_turns > 0 else len(messages)
+        return user_indexes[-self.keep_recent_turns]
+
+    def _elide(self, messages: List[Any], index: int, min_tokens: int) -> int:
+        message = messages[index]
+        content = _field(message, "content")
+        if not isinstance(content, str) or self._counts[index] < min_tokens:
+            return 0
+        head = content[:ELIDED_HEAD_CHARS]
+        removed = self.count_text(content[ELIDED_HEAD_CHARS:])
+        message = dict(as_dict(message))
+        message["content"] = f"{head}\n[... {removed} tokens of older output elided ...]"
+        messages[index] = message
+        before = self._counts[index]
+        self._counts[index] = self.count_message(message)
+        return before - self._counts[index]
+
+    def compact(self, messages: List[Any]) -> int:
+        """
+        Bring `messages` under the token budget, in place.
+
+        Returns:
+            Tokens saved by this call (0 if nothing had to change)
+        """
+        self._sync_counts(messages)
+        if self.total_tokens <= self.max_tokens:
+            return 0
+
+        saved = 0
+        protected = self._protected_start(messages)
+        excess = lambda: sum(self._counts) - self.max_tokens
+
+        # 1. Old tool outputs, then 2. long old assistant texts
+        for role in ("tool", "assistant"):
+            for i in range(1, protected):
+                if excess() <= 0:
+                    break
+                if _field(messages[i], "role") == role:
+                    saved += self._elide(messages, i, min_tokens=ELIDED_HEAD_CHARS // 2)
+
+        # 3. Oldest whole turns
+        while excess() > 0:
+            user_indexes = [
+                i for i in range(1, protected) if _field(messages[i], "role") == "user"
+            ]
+            if not user_indexes:
+                break
+            start = user_indexes[0]
+            end = user_indexes[1] if len(user_indexes) > 1 else protected
+            saved += sum(self._counts[start:end])
+            del messages[start:end]
+            del self._counts[start:end]
+            protected -= end - start
+
+        self.total_tokens = sum(self._counts)
+        self.tokens_saved += saved
+        return saved
+
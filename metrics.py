@@ -0,0 +1,260 @@
+"""
+Low-overhead per-tool metrics for the MCP server.
+
+Every observation goes into a fixed-bucket histogram: recording is a bisect
+and a few additions under a lock, no samples are kept. Quantiles are
+estimated from the buckets when a snapshot is taken.
+
+Inside a tool, `metrics.phase("execute")` times a phase of the current call
+and `metrics.note(rows=...)` adds to its counters. The call itself is opened
+and closed by `ToolMetrics.instrument` (a decorator), which also records the
+total duration, errors and the size of the result. The current call is kept
+per thread, so the blocking DB tools can be instrumented without passing it
+around.
+"""
+import asyncio
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Seconds
+TIME_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+# Rows / bytes
+SIZE_BUCKETS = tuple(float(10 ** i) for i in range(9))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Exact nearest-rank percentile of raw samples (for the benchmarks)."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Estimate by linear interpolation inside the bucket holding the q-th value."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                estimate = lower + (upper - lower) * (rank - seen) / n
+                return max(min(estimate, self.max), self.min)
+            seen += n
+        return self.max
+
+    def summary(self, scale: float = 1.0) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count * scale, 3) if self.count else 0.0,
+            "p50": round(self.quantile(0.5) * scale, 3),
+            "p99": round(self.quantile(0.99) * scale, 3),
+            "max": round(self.max * scale, 3),
+        }
+
+
+class _Call:
+    """Phases and counters of one tool call in progress."""
+
+    __slots__ = ("phases", "counters")
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+
+
+class ToolMetrics:
+    def __init__(self, slow_seconds: float = 1.0, slow_log_size: int = 50, slow_log: Optional[Callable[[dict], None]] = None):
+        self.slow_seconds = slow_seconds
+        self.slow_log = slow_log
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._calls: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}  # (tool, metric) -> Histogram
+        self._slow: List[dict] = []
+        self._slow_log_size = slow_log_size
+
+    # --- Recording ---
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a phase of the current call (no-op outside an instrumented call)."""
+        call = getattr(self._local, "call", None)
+        if call is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            call.phases[name] = call.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def note(self, **counters: int):
+        """Add to counters (e.g. rows=...) of the current call."""
+        call = getattr(self._local, "call", None)
+        if call is not None:
+            for name, value in counters.items():
+                call.counters[name] = call.counters.get(name, 0) + value
+
+    def _observe(self, tool: str, metric: str, value: float, buckets: Tuple[float, ...]):
+        histogram = self._histograms.get((tool, metric))
+        if histogram is None:
+            histogram = self._histograms.setdefault((tool, metric), Histogram(buckets))
+        histogram.observe(value)
+
+    def record(self, tool: str, elapsed: float, error: bool, size: int, call: _Call, detail: Callable[[], dict]):
+        with self._lock:
+            self._calls[tool] = self._calls.get(tool, 0) + 1
+            if error:
+                self._errors[tool] = self._errors.get(tool, 0) + 1
+            self._observe(tool, "duration_seconds", elapsed, TIME_BUCKETS)
+            for phase, seconds in call.phases.items():
+                self._observe(tool, f"{phase}_seconds", seconds, TIME_BUCKETS)
+            self._observe(tool, "result_bytes", size, SIZE_BUCKETS)
+            for name, value in call.counters.items():
+                self._observe(tool, name, value, SIZE_BUCKETS)
+        if elapsed >= self.slow_seconds:
+            entry = {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "tool": tool,
+                "seconds": round(elapsed, 4),
+                "phases": {phase: round(seconds, 4) for phase, seconds in call.phases.items()},
+                **call.counters,
+                **detail(),
+            }
+            with self._lock:
+                self._slow.append(entry)
+                del self._slow[: -self._slow_log_size]
+            if self.slow_log:
+                self.slow_log(entry)
+
+    def instrument(
+        self,
+        tool: str,
+        is_error: Callable[[Any], bool],
+        size_of: Callable[[Any], int],
+        detail: Callable[[Dict[str, Any]], dict],
+    ):
+        """
+        Decorator for a tool body: opens a call for the current thread, times
+        it and records it. Coroutine functions are timed too, but their phases
+        are not tracked. `detail(arguments)` gets the call's arguments by name
+        and is only evaluated for slow calls, to describe them in the slow log.
+        """
+        def decorator(fn):
+            signature = inspect.signature(fn)
+
+            def finish(start: float, error: bool, result: Any, call: _Call, args, kwargs):
+                self.record(
+                    tool, time.perf_counter() - start, error,
+                    size_of(result) if result is not None else 0, call,
+                    lambda: detail(signature.bind_partial(*args, **kwargs).arguments),
+                )
+
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    result, error = None, True
+                    try:
+                        result = await fn(*args, **kwargs)
+                        error = is_error(result)
+                        return result
+                    finally:
+                        finish(start, error, result, _Call(), args, kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                call = _Call()
+                outer = getattr(self._local, "call", None)
+                self._local.call = call
+                start = time.perf_counter()
+                result, error = None, True
+                try:
+                    result = fn(*args, **kwargs)
+                    error = is_error(result)
+                    return result
+                finally:
+                    self._local.call = outer
+                    finish(start, error, result, call, args, kwargs)
+            return wrapper
+        return decorator
+
+    # --- Reporting ---
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            tools = {}
+            for tool, calls in sorted(self._calls.items()):
+                entry = {"calls": calls, "errors": self._errors.get(tool, 0)}
+                for (name, metric), histogram in sorted(self._histograms.items()):
+                    if name != tool:
+                        continue
+                    if metric.endswith("_seconds"):
+                        entry[metric[: -len("_seconds")] + "_ms"] = histogram.summary(scale=1000)
+                    else:
+                        entry[metric] = histogram.summary()
+                tools[tool] = entry
+            return {
+                "uptime_seconds": round(time.time() - self.started, 1),
+                "tools": tools,
+                "slow_calls": list(self._slow),
+            }
+
+    def prometheus(self, prefix: str = "mcp", gauges: Optional[Dict[str, float]] = None) -> str:
+        """Render all histograms and counters in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for kind, values in (("calls_total", self._calls), ("errors_total", self._errors)):
+                lines.append(f"# TYPE {prefix}_tool_{kind} counter")
+                for tool, value in sorted(values.items()):
+                    lines.append(f'{prefix}_tool_{kind}{{tool="{tool}"}} {value}')
+            by_metric: Dict[str, List[Tuple[str, Histogram]]] = {}
+            for (tool, metric), histogram in sorted(self._histograms.items()):
+                by_metric.setdefault(metric, []).append((tool, histogram))
+            for metric, entries in by_metric.items():
+                name = f"{prefix}_tool_{metric}"
+                lines.append(f"# TYPE {name} histogram")
+                for tool, histogram in entries:
+                    cumulative = 0
+                    for bound, n in zip(histogram.buckets, histogram.counts):
+                        cumulative += n
+                        lines.append(f'{name}_bucket{{tool="{tool}",le="{bound:g}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{tool="{tool}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{tool="{tool}"}} {histogram.sum:.6g}')
+                    lines.append(f'{name}_count{{tool="{tool}"}} {histogram.count}')
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,170 @@
+"""
+Size-bounded tool observations for the agent clients.
+
+A tool result larger than `max_chars` is not put into the prompt as is.
+Instead the full text is spilled to a local file and the model gets a short
+observation with:
+
+- for `run_sql` results: the column list, per-column statistics and the
+  first/last rows;
+- for anything else: the first and last lines;
+- a handle it can pass to the client-side `read_observation` tool to read
+  the full result page by page.
+"""
+import ast
+import base64
+import json
+import os
+import statistics
+import zlib
+from typing import Any, Dict, List, Optional
+
+READ_OBSERVATION_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "read_observation",
+        "description": (
+            "Read a page of a large tool result that was shortened in the "
+            "conversation. Use the handle given in the shortened observation."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "handle": {"type": "string", "description": "Handle of the stored result"},
+                "offset": {"type": "integer", "description": "First line to return (0-based)", "default": 0},
+                "limit": {"type": "integer", "description": "Number of lines to return", "default": 50},
+            },
+            "required": ["handle"],
+        },
+    },
+}
+
+
+def _parse_sql_result(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Recover columns and rows from a run_sql result: the columnar JSON formats
+    directly, the text format by evaluating each row's tuple literal.
+    """
+    if text.startswith("{"):
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            return None
+        if payload.get("encoding") == "zlib+base64":
+            payload = json.loads(zlib.decompress(base64.b64decode(payload["data"])))
+        if "columns" not in payload or "data" not in payload:
+            return None
+        rows = list(zip(*payload["data"])) if payload["data"] else []
+        return {"columns": payload["columns"], "rows": rows, "footer": []}
+
+    if not text.startswith("Columns: "):
+        return None
+    lines = text.splitlines()
+    try:
+        columns = ast.literal_eval(lines[0][len("Columns: "):])
+    except (ValueError, SyntaxError):
+        return None
+    rows, footer = [], []
+    for line in lines[2:]:
+        if line.startswith("-- "):
+            footer.append(line)
+            continue
+        try:
+            rows.append(ast.literal_eval(line))
+        except (ValueError, SyntaxError):
+            return None
+    return {"columns": columns, "rows": rows, "footer": footer}
+
+
+def _column_stats(values: List[Any]) -> str:
+    present = [v for v in values if v is not None]
+    parts = [f"non-null {len(present)}/{len(values)}"]
+    distinct = len(set(map(repr, present)))
+    parts.append(f"distinct {distinct}")
+    numbers = [v for v in present if isinstance(v, (int, float)) and not isinstance(v, bool)]
+    if numbers and len(numbers) == len(present):
+        parts.append(f"min {min(numbers)}, max {max(numbers)}, mean {statistics.fmean(numbers):.4g}")
+    elif present:
+        lengths = [len(str(v)) for v in present]
+        parts.append(f"length {min(lengths)}..{max(lengths)}")
+    return ", ".join(parts)
+
+
+class ObservationStore:
+    def __init__(self, directory: str, max_chars: int, head_rows: int = 10, tail_rows: int = 5):
+        self.directory = directory
+        self.max_chars = max_chars
+        self.head_rows = head_rows
+        self.tail_rows = tail_rows
+        self._count = 0
+
+    def _spill(self, text: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        self._count += 1
+        handle = f"obs-{os.getpid()}-{self._count}"
+        path = os.path.join(self.directory, f"{handle}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return handle
+
+    def shape(self, tool_name: str, text: str) -> str:
+        """Return `text` itself if small enough, otherwise a bounded summary."""
+        if len(text) <= self.max_chars:
+            return text
+        parsed = _parse_sql_result(text) if tool_name == "run_sql" else None
+        if parsed is not None and text.startswith("{"):
+            # Store JSON results one row per line so read_observation pages are rows
+            handle = self._spill(
+                f"Columns: {parsed['columns']}\nRows:\n" + "".join(f"{row}\n" for row in parsed["rows"])
+            )
+        else:
+            handle = self._spill(text)
+
+        if parsed is not None:
+            columns, rows = parsed["columns"], parsed["rows"]
+            out = [f"[Large result: {len(rows)} rows, {len(text)} chars. Full result: handle '{handle}']"]
+            out.append(f"Columns: {columns}")
+            out.append("Column stats:")
+            for i, column in enumerate(columns):
+                out.append(f"  {column}: {_column_stats([row[i] for row in rows])}")
+            out.append(f"First {min(self.head_rows, len(rows))} rows:")
+            out.extend(f"{row}" for row in rows[: self.head_rows])
+            if len(rows) > self.head_rows + self.tail_rows:
+                out.append(f"... {len(rows) - self.head_rows - self.tail_rows} rows omitted ...")
+                out.append(f"Last {self.tail_rows} rows:")
+                out.extend(f"{row}" for row in rows[-self.tail_rows:])
+            else:
+                out.extend(f"{row}" for row in rows[self.head_rows:])
+            out.extend(parsed["footer"])
+        else:
+            lines = text.splitlines()
+            out = [f"[Large result: {len(lines)} lines, {len(text)} chars. Full result: handle '{handle}']"]
+            out.extend(lines[: self.head_rows])
+            if len(lines) > self.head_rows + self.tail_rows:
+                out.append(f"... {len(lines) - self.head_rows - self.tail_rows} lines omitted ...")
+            out.extend(lines[max(self.head_rows, len(lines) - self.tail_rows):])
+
+        out.append(f"Use read_observation(handle='{handle}', offset, limit) to read more.")
+        shaped = "\n".join(out)
+        # Rows can be arbitrarily wide, keep the summary itself bounded too
+        if len(shaped) > self.max_chars:
+            shaped = shaped[: self.max_chars] + f"\n[... cut; use read_observation(handle='{handle}') ...]"
+        return shaped
+
+    def read(self, handle: str, offset: int = 0, limit: int = 50) -> str:
+        """Return lines [offset, offset + limit) of a stored result."""
+        if os.sep in handle or not handle.startswith("obs-"):
+            return f"Error: invalid handle {handle!r}"
+        path = os.path.join(self.directory, f"{handle}.txt")
+        try:
+            with open(path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return f"Error: unknown handle {handle!r}"
+        offset = max(offset, 0)
+        page = "\n".join(lines[offset: offset + max(limit, 1)])
+        end = min(offset + max(limit, 1), len(lines))
+        shaped = f"[Lines {offset}-{end} of {len(lines)}]\n{page}"
+        if len(shaped) > self.max_chars:
+            shaped = shaped[: self.max_chars] + "\n[... page cut, use a smaller limit ...]"
+        return shaped
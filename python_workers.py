@@ -0,0 +1,356 @@
+"""
+Warm worker processes for the `run_python` tool.
+
+Each worker is a separate `python python_workers.py` process that has already
+imported a configurable set of modules and applied its resource limits. The
+MCP server talks to it over stdin/stdout with one JSON message per line, so a
+slow or runaway snippet only ever blocks (or kills) its own worker, never the
+stdio server itself.
+"""
+import io
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from contextlib import redirect_stdout
+
+try:
+    import resource  # POSIX only
+except ImportError:
+    resource = None
+
+WORKER_SCRIPT = os.path.abspath(__file__)
+STARTUP_TIMEOUT = 60  # seconds to wait for a worker to finish preloading
+
+
+# --- Worker side ---
+
+def _apply_memory_limit(memory_mb: int):
+    if resource is None or memory_mb <= 0:
+        return
+    limit = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def _apply_cpu_limit(cpu_seconds: int):
+    """Allow `cpu_seconds` more CPU time from now; the kernel sends SIGXCPU past it."""
+    if resource is None or cpu_seconds <= 0:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = used + cpu_seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+def _execute(code: str, namespace: dict) -> str:
+    # Capture stdout
+    output_buffer = io.StringIO()
+    try:
+        with redirect_stdout(output_buffer):
+            exec(code, namespace)
+        output = output_buffer.getvalue()
+        return output if output else "Code executed successfully (no output)"
+    except Exception as e:
+        return f"Error: {type(e).__name__}: {str(e)}"
+
+def _worker_main(argv):
+    config = json.loads(argv[1]) if len(argv) > 1 else {}
+
+    # Keep a private handle on the real stdout for the protocol and point fd 1
+    # at stderr, so snippets writing to the fd directly cannot corrupt it.
+    protocol_out = os.fdopen(os.dup(1), "w", buffering=1, encoding="utf-8")
+    os.dup2(2, 1)
+
+    for module in config.get("preload", []):
+        try:
+            __import__(module)
+        except Exception:
+            pass  # optional modules (e.g. pandas) may not be installed
+    _apply_memory_limit(config.get("memory_mb", 0))
+    cpu_seconds = config.get("cpu_seconds", 0)
+
+    namespace = {"__builtins__": __builtins__}
+    protocol_out.write(json.dumps({"ready": True}) + "\n")
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        if request.get("fresh", True):
+            namespace = {"__builtins__": __builtins__}
+        _apply_cpu_limit(cpu_seconds)
+        output = _execute(request["code"], namespace)
+        protocol_out.write(json.dumps({"output": output}) + "\n")
+
+
+# --- Server side ---
+
+class WorkerError(Exception):
+    """The worker process died and has to be replaced."""
+
+
+class WorkerTimeout(WorkerError):
+    """The worker overran its wall-clock timeout and was killed."""
+
+
+class Worker:
+    """Handle on one worker process."""
+
+    def __init__(self, config: dict):
+        self.process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT, json.dumps(config)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+        )
+        # A reader thread turns the blocking pipe into a queue we can wait on
+        # with a timeout, portably.
+        self._replies = queue.Queue()
+        threading.Thread(target=self._read_replies, daemon=True).start()
+        self._wait_reply(STARTUP_TIMEOUT)
+
+    def _read_replies(self):
+        for line in self.process.stdout:
+            self._replies.put(json.loads(line))
+        self._replies.put(None)  # EOF: the process exited
+
+    def _wait_reply(self, timeout: float) -> dict:
+        try:
+            reply = self._replies.get(timeout=timeout)
+        except queue.Empty:
+            self.kill()
+            raise WorkerTimeout(f"Execution timed out after {timeout:g}s, worker killed")
+        if reply is None:
+            code = self.process.wait()
+            raise WorkerError(
+                f"Worker exited with code {code} "
+                "(memory or CPU limit exceeded, or the code called exit())"
+            )
+        return reply
+
+    def run(self, code: str, timeout: float, fresh: bool = True) -> str:
+        try:
+            self.process.stdin.write(json.dumps({"code": code, "fresh": fresh}) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.kill()
+            raise WorkerError("Worker is no longer running")
+        return self._wait_reply(timeout)["output"]
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self):
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+
+class _Session:
+    """A worker dedicated to one session id, whose globals survive between calls."""
+
+    def __init__(self, worker: Worker):
+        self.worker = worker
+        self.lock = threading.Lock()  # calls within a session run one at a time
+        self.last_used = time.monotonic()
+        # An adopted pool worker still holds the last anonymous call's globals
+        self.fresh = True
+
+
+class PythonWorkerPool:
+    """
+    Fixed-size pool of warm workers. Each call is dispatched to a free worker;
+    a worker that times out or dies is killed and replaced in the background.
+
+    Calls with a session id instead run on a worker dedicated to that session,
+    keeping its globals between calls. At most `max_sessions` sessions exist at
+    once and sessions idle for `session_idle_timeout` seconds are closed.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        timeout: float,
+        memory_mb: int,
+        cpu_seconds: int,
+        preload: list[str],
+        max_sessions: int = 4,
+        session_idle_timeout: float = 900,
+    ):
+        self.size = size
+        self.timeout = timeout
+        self.config = {"memory_mb": memory_mb, "cpu_seconds": cpu_seconds, "preload": preload}
+        self.max_sessions = max_sessions
+        self.session_idle_timeout = session_idle_timeout
+        self._idle = queue.Queue()
+        self._sessions = {}  # session id -> _Session
+        self._started = False
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "timeouts": 0, "crashes": 0, "respawns": 0, "sessions_evicted": 0}
+
+    def start(self):
+        """Spawn all workers (in parallel, in the background). Safe to call twice."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.size):
+            threading.Thread(target=self._spawn, daemon=True).start()
+        threading.Thread(target=self._reap_sessions, daemon=True).start()
+
+    def _spawn(self):
+        try:
+            self._idle.put(Worker(self.config))
+        except Exception as e:
+            print(f"run_python worker failed to start: {e}", file=sys.stderr)
+
+    def _record_failure(self, error: WorkerError):
+        with self._lock:
+            self._stats["timeouts" if isinstance(error, WorkerTimeout) else "crashes"] += 1
+
+    def run(self, code: str, timeout: float = 0, session_id: str = "") -> str:
+        """
+        Run `code` and return its stdout. Without a session id the code runs
+        in a fresh namespace on any free worker. `timeout` can only shorten
+        the pool's timeout, never extend it.
+        """
+        self.start()
+        timeout = min(timeout, self.timeout) if timeout > 0 else self.timeout
+        if session_id:
+            return self._run_in_session(session_id, code, timeout)
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            return f"Error: TimeoutError: no free run_python worker within {timeout:g}s"
+
+        with self._lock:
+            self._stats["calls"] += 1
+        try:
+            output = worker.run(code, timeout)
+        except WorkerError as e:
+            self._record_failure(e)
+            with self._lock:
+                self._stats["respawns"] += 1
+            worker.kill()
+            threading.Thread(target=self._spawn, daemon=True).start()
+            return f"Error: {type(e).__name__}: {str(e)}"
+        self._idle.put(worker)
+        return output
+
+    # --- Sessions ---
+
+    def _open_session(self, session_id: str) -> _Session:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                return session
+            if len(self._sessions) >= self.max_sessions:
+                raise RuntimeError(
+                    f"Too many python sessions ({self.max_sessions}); close one first"
+                )
+            # Reserve the slot before the (possibly slow) worker checkout
+            self._sessions[session_id] = None
+        try:
+            # Adopt a warm worker if one is free and let the pool replace it
+            worker = self._idle.get_nowait()
+            threading.Thread(target=self._spawn, daemon=True).start()
+        except queue.Empty:
+            try:
+                worker = Worker(self.config)
+            except Exception:
+                with self._lock:
+                    self._sessions.pop(session_id, None)
+                raise
+        session = _Session(worker)
+        with self._lock:
+            self._sessions[session_id] = session
+        return session
+
+    def _run_in_session(self, session_id: str, code: str, timeout: float) -> str:
+        try:
+            session = self._open_session(session_id)
+        except Exception as e:
+            return f"Error: {type(e).__name__}: {str(e)}"
+        if session is None:
+            return f"Error: RuntimeError: session {session_id!r} is still starting"
+
+        with session.lock:
+            with self._lock:
+                self._stats["calls"] += 1
+            try:
+                output = session.worker.run(code, timeout, fresh=session.fresh)
+                session.fresh = False
+            except WorkerError as e:
+                self._record_failure(e)
+                self.close_session(session_id)
+                return (
+                    f"Error: {type(e).__name__}: {str(e)}. "
+                    f"Session {session_id!r} was closed and its state is lost."
+                )
+            session.last_used = time.monotonic()
+        return output
+
+    def reset_session(self, session_id: str) -> bool:
+        """Clear a session's globals, keeping its worker (and its imports) warm."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is None:
+            return False
+        with session.lock:
+            try:
+                session.worker.run("", self.timeout, fresh=True)
+            except WorkerError:
+                self.close_session(session_id)
+                return False
+            session.last_used = time.monotonic()
+        return True
+
+    def close_session(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        session.worker.kill()
+        return True
+
+    def _reap_sessions(self):
+        while True:
+            time.sleep(min(30, self.session_idle_timeout))
+            now = time.monotonic()
+            with self._lock:
+                idle = [
+                    sid for sid, session in self._sessions.items()
+                    if session is not None
+                    and now - session.last_used > self.session_idle_timeout
+                    and not session.lock.locked()
+                ]
+            for sid in idle:
+                if self.close_session(sid):
+                    with self._lock:
+                        self._stats["sessions_evicted"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "size": self.size,
+                "idle": self._idle.qsize(),
+                "sessions": sorted(self._sessions),
+            }
+
+    def close(self):
+        for session_id in list(self._sessions):
+            self.close_session(session_id)
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                break
+
+
+if __name__ == "__main__":
+    _worker_main(sys.argv)
@@ -0,0 +1,306 @@
+"""
+Record and replay agent sessions.
+
+Recording (set RECORD_SESSION=<file.jsonl> when running client_v5.py) writes
+one JSON line per event:
+
+- {"kind": "user", "content": ...}: a user input
+- {"kind": "llm", "request": ..., "response": ..., "usage": ..., "elapsed": ...}:
+  one LLM call; the request holds the messages added since the previous
+  assistant message (the user input or the tool results it answers)
+- {"kind": "tool", "name": ..., "arguments": ..., "result": ..., "elapsed": ...}:
+  one tool call and its result as the model saw it (after observation shaping)
+
+Replaying (`python replay.py <file.jsonl>`) runs the same session through
+client_v5's agent loop against the server.py next to this file, with a stub
+LLM that streams back the recorded responses instead of calling the API, like
+client_v2's `mock_llm_router` but scripted from the recording. No network
+access or API key is needed, and the run is deterministic, so it serves both
+as an end-to-end latency benchmark and as a regression check: every tool
+result is compared against the recorded one.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from chat_messages import as_dict
+from metrics import percentile
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+
+# Ids the server makes up per run. They differ between recording and replay,
+# so they are mapped (recorded -> replayed) instead of compared.
+_VOLATILE_IDS = [
+    re.compile(r'continuation_token"?: ?"?([A-Za-z0-9_-]{16,})'),
+    re.compile(r"\b(obs-\d+-\d+)\b"),
+]
+# Parts of a result that legitimately change from run to run
+_VOLATILE_TEXT = [
+    (re.compile(r"-- cache: \w+\n?"), ""),
+    (re.compile(r',"cache":"\w+"'), ""),
+]
+
+
+def _volatile_ids(text: str) -> List[str]:
+    return [m.group(1) for pattern in _VOLATILE_IDS for m in pattern.finditer(text)]
+
+
+def _normalize(text: str, id_map: Dict[str, str]) -> str:
+    for old, new in id_map.items():
+        text = text.replace(old, new)
+    for pattern, repl in _VOLATILE_TEXT:
+        text = pattern.sub(repl, text)
+    return text
+
+
+class SessionRecorder:
+    """Appends session events to a JSONL file, one line per event."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()  # tool calls finish concurrently
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _write(self, record: Dict[str, Any]):
+        record["ts"] = round(time.time(), 3)
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def record_user(self, content: str):
+        self._write({"kind": "user", "content": content})
+
+    def record_llm(self, messages: List[Any], response: Dict[str, Any], usage: Any, elapsed: float):
+        # Only what is new since the model last spoke, not the whole history
+        start = 0
+        for i, message in enumerate(messages):
+            role = message.get("role") if isinstance(message, dict) else getattr(message, "role", None)
+            if role == "assistant":
+                start = i + 1
+        new = [as_dict(m) for m in messages[start:]]
+        self._write({
+            "kind": "llm",
+            "request": {"message_count": len(messages), "new_messages": new},
+            "response": response,
+            "usage": {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+            if usage else None,
+            "elapsed": round(elapsed, 4),
+        })
+
+    def record_tool(self, name: str, arguments: str, result: str, elapsed: float):
+        self._write({
+            "kind": "tool",
+            "name": name,
+            "arguments": arguments,
+            "result": result,
+            "elapsed": round(elapsed, 4),
+        })
+
+    def close(self):
+        self._file.close()
+
+
+def load_recording(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# --- Stub LLM ---
+
+class _ReplayStream:
+    """Async iterator of chunks shaped like the OpenAI streaming API's."""
+
+    def __init__(self, response: Dict[str, Any], usage: Optional[Dict[str, int]]):
+        self._chunks = []
+        if response.get("content"):
+            delta = SimpleNamespace(content=response["content"], tool_calls=None)
+            self._chunks.append(SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None))
+        for index, call in enumerate(response.get("tool_calls") or []):
+            function = SimpleNamespace(
+                name=call["function"]["name"], arguments=call["function"]["arguments"]
+            )
+            tool_call = SimpleNamespace(index=index, id=call["id"], function=function)
+            delta = SimpleNamespace(content=None, tool_calls=[tool_call])
+            self._chunks.append(SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None))
+        if usage:
+            self._chunks.append(SimpleNamespace(choices=[], usage=SimpleNamespace(**usage)))
+
+    def __aiter__(self):
+        return self
+
+    async def close(self):
+        self._chunks.clear()
+
+    async def __anext__(self):
+        if not self._chunks:
+            raise StopAsyncIteration
+        await asyncio.sleep(0)
+        return self._chunks.pop(0)
+
+
+class ReplayLLM:
+    """
+    Stands in for `AsyncOpenAI`: each `chat.completions.create` call returns
+    the next recorded response. Volatile ids the model copied from earlier
+    tool results (continuation tokens, observation handles) are rewritten to
+    the ones the replayed run produced.
+    """
+
+    def __init__(self, records: List[Dict[str, Any]], id_map: Dict[str, str]):
+        self._responses = [r for r in records if r["kind"] == "llm"]
+        self._id_map = id_map
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs) -> _ReplayStream:
+        if self.calls >= len(self._responses):
+            self.calls += 1
+            return _ReplayStream({"content": "[replay] recording exhausted"}, None)
+        record = self._responses[self.calls]
+        self.calls += 1
+        response = json.loads(_normalize(json.dumps(record["response"]), self._id_map))
+        return _ReplayStream(response, record.get("usage"))
+
+
+class ReplayChecker(SessionRecorder):
+    """
+    Recorder for the replayed run that compares each tool result with the
+    recorded one (in call order per tool name and arguments) as it arrives.
+    """
+
+    def __init__(self, path: str, records: List[Dict[str, Any]], id_map: Dict[str, str]):
+        super().__init__(path)
+        self._id_map = id_map
+        self._expected: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            if record["kind"] == "tool":
+                self._expected.setdefault(record["name"], []).append(record)
+        self.tool_elapsed: Dict[str, List[float]] = {}
+        self.llm_elapsed: List[float] = []
+        self.matches = 0
+        self.mismatches: List[str] = []
+        self.unexpected: List[str] = []
+
+    def record_llm(self, messages, response, usage, elapsed):
+        super().record_llm(messages, response, usage, elapsed)
+        self.llm_elapsed.append(elapsed)
+
+    def record_tool(self, name, arguments, result, elapsed):
+        super().record_tool(name, arguments, result, elapsed)
+        self.tool_elapsed.setdefault(name, []).append(elapsed)
+        candidates = self._expected.get(name, [])
+        normalized_args = _normalize(arguments, self._id_map)
+        for i, expected in enumerate(candidates):
+            if _normalize(expected["arguments"], self._id_map) == normalized_args:
+                candidates.pop(i)
+                break
+        else:
+            self.unexpected.append(f"{name}({arguments})")
+            return
+
+        # Learn how this run's ids map to the recorded ones before comparing
+        with self._lock:
+            for old, new in zip(_volatile_ids(expected["result"]), _volatile_ids(result)):
+                self._id_map.setdefault(old, new)
+        if _normalize(expected["result"], self._id_map) == _normalize(result, {}):
+            self.matches += 1
+        else:
+            self.mismatches.append(f"{name}({arguments})")
+
+    def report(self, recorded: List[Dict[str, Any]], wall: float) -> Dict[str, Any]:
+        recorded_tools: Dict[str, List[float]] = {}
+        for record in recorded:
+            if record["kind"] == "tool":
+                recorded_tools.setdefault(record["name"], []).append(record["elapsed"])
+        tools = {}
+        for name in sorted(set(recorded_tools) | set(self.tool_elapsed)):
+            replayed = self.tool_elapsed.get(name, [])
+            original = recorded_tools.get(name, [])
+            tools[name] = {
+                "calls": len(replayed),
+                "replay_p50_ms": round(percentile(replayed, 50) * 1000, 2),
+                "replay_p99_ms": round(percentile(replayed, 99) * 1000, 2),
+                "recorded_p50_ms": round(percentile(original, 50) * 1000, 2),
+            }
+        return {
+            "wall_seconds": round(wall, 3),
+            "llm_calls": len(self.llm_elapsed),
+            "recorded_llm_seconds": round(sum(r["elapsed"] for r in recorded if r["kind"] == "llm"), 3),
+            "tools": tools,
+            "results_matched": self.matches,
+            "results_mismatched": self.mismatches,
+            "unexpected_calls": self.unexpected,
+            "missing_calls": [
+                f"{r['name']}({r['arguments']})" for rs in self._expected.values() for r in rs
+            ],
+        }
+
+
+async def replay(path: str, output: str) -> Dict[str, Any]:
+    # Imported here so that client_v5 can import SessionRecorder from this module
+    import client_v5
+
+    records = load_recording(path)
+    inputs = [r["content"] for r in records if r["kind"] == "user"]
+    id_map: Dict[str, str] = {}
+    checker = ReplayChecker(output, records, id_map)
+    started = time.perf_counter()
+    try:
+        await client_v5.run_agent_loop(
+            llm=ReplayLLM(records, id_map),
+            inputs=iter(inputs),
+            recorder=checker,
+            server_script=SERVER_SCRIPT,
+        )
+    finally:
+        checker.close()
+    return checker.report(records, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded client_v5 session offline.")
+    parser.add_argument("recording", help="JSONL file written with RECORD_SESSION")
+    parser.add_argument(
+        "--output",
+        default="",
+        help="Where to record the replayed run (default: a temporary file)",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON only")
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(tempfile.mkdtemp(prefix="replay-"), "replayed.jsonl")
+    report = asyncio.run(replay(args.recording, output))
+    report["replay_recording"] = output
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print("\n" + "=" * 50)
+        print(f"Replayed {args.recording} in {report['wall_seconds']}s "
+              f"({report['llm_calls']} stubbed LLM calls; "
+              f"the recorded run spent {report['recorded_llm_seconds']}s in the LLM)")
+        for name, stats in report["tools"].items():
+            print(f"  {name:<22} {stats['calls']:>4} calls  p50 {stats['replay_p50_ms']:>8} ms  "
+                  f"p99 {stats['replay_p99_ms']:>8} ms  (recorded p50 {stats['recorded_p50_ms']} ms)")
+        print(f"Tool results matching the recording: {report['results_matched']}")
+        for label in ("results_mismatched", "unexpected_calls", "missing_calls"):
+            for call in report[label]:
+                print(f"  {label.replace('_', ' ')}: {call}")
+        print(f"Replayed run recorded to {output}")
+    failed = report["results_mismatched"] or report["unexpected_calls"] or report["missing_calls"]
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Connect a client to the MCP server, either by spawning it over stdio (one
+server process per session, the default) or by attaching to a long-lived
+shared server started with `python server.py --transport streamable-http`
+(or `--transport sse`).
+
+A shared server skips the per-session interpreter start and `mcp` import,
+and its connection pools, caches and warm run_python workers serve every
+session attached to it.
+"""
+import sys
+from contextlib import asynccontextmanager
+
+from mcp import StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+
+@asynccontextmanager
+async def connect_server(server_script: str, url: str = ""):
+    """
+    Yields the (read, write) streams for a `ClientSession`.
+
+    Args:
+        server_script: server.py to spawn over stdio when no url is given
+        url: Address of a shared server, e.g. 'http://127.0.0.1:8000/mcp'
+            (streamable HTTP) or 'http://127.0.0.1:8000/sse' (SSE)
+    """
+    if not url:
+        server_params = StdioServerParameters(
+            command=sys.executable, args=[server_script], env=None
+        )
+        async with stdio_client(server_params) as (read, write):
+            yield read, write
+    elif url.rstrip("/").endswith("/sse"):
+        from mcp.client.sse import sse_client
+
+        async with sse_client(url) as (read, write):
+            yield read, write
+    else:
+        from mcp.client.streamable_http import streamablehttp_client
+
+        async with streamablehttp_client(url) as (read, write, _):
+            yield read, write
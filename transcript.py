@@ -0,0 +1,126 @@
+"""
+Append-only JSONL transcript of an agent session.
+
+Instead of re-dumping the whole `messages` list after every answer, each
+message is written once, as one JSON line, when it is added to the history.
+Lines are serialized by the caller (so later in-place edits of the history,
+e.g. by the compactor, don't change what was recorded) and written and
+flushed by a background thread, so a turn costs the same however long the
+session gets.
+
+Files live in `directory` as `<session>.<segment>.jsonl`; when a segment grows
+past `max_bytes` the writer starts the next one. `load_transcript` reads all
+segments back in order to resume a session.
+"""
+import atexit
+import glob
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from chat_messages import as_dict
+
+FLUSH_INTERVAL = 1.0  # seconds between flushes while messages keep coming
+
+
+def _segments(directory: str, session_id: str) -> List[str]:
+    paths = glob.glob(os.path.join(directory, f"{glob.escape(session_id)}.*.jsonl"))
+
+    def segment(path: str) -> int:
+        try:
+            return int(path.rsplit(".", 2)[-2])
+        except ValueError:
+            return -1
+
+    return sorted((p for p in paths if segment(p) >= 0), key=segment)
+
+
+class TranscriptWriter:
+    def __init__(self, directory: str, session_id: Optional[str] = None, max_bytes: int = 8 * 1024 * 1024):
+        self.directory = directory
+        self.session_id = session_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        # Resuming continues after the last existing segment
+        existing = _segments(directory, self.session_id)
+        self._segment = int(existing[-1].rsplit(".", 2)[-2]) if existing else 0
+        self._file = None
+        self._size = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+        self._closed = False
+        atexit.register(self.close)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f"{self.session_id}.{self._segment:04d}.jsonl")
+
+    def append(self, message: Any):
+        """Queue one message for writing. Serialization happens here, writing in the background."""
+        record = {"ts": round(time.time(), 3), "message": as_dict(message)}
+        self._queue.put(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def _open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+
+    def _write_loop(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                line = self._queue.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                line = ""
+            if line is None:
+                break
+            if line:
+                if self._file is None or self._size >= self.max_bytes:
+                    if self._file is not None:
+                        self._file.close()
+                        self._segment += 1
+                    self._open()
+                self._file.write(line)
+                self._size += len(line.encode("utf-8"))
+            # Flush once the burst is written, or at least every FLUSH_INTERVAL
+            if self._file is not None and (
+                self._queue.empty() or time.monotonic() - last_flush >= FLUSH_INTERVAL
+            ):
+                self._file.flush()
+                last_flush = time.monotonic()
+        if self._file is not None:
+            self._file.close()
+
+    def close(self):
+        """Write everything still queued and close the file. Also runs at exit."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+
+def load_transcript(directory: str, session_id: str) -> List[Dict[str, Any]]:
+    """
+    Read a session's messages back, oldest first, for resuming it.
+
+    A trailing unfinished turn (e.g. the client was killed while tools were
+    running) is dropped, so the history always ends with a final answer.
+    """
+    messages = []
+    for path in _segments(directory, session_id):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    messages.append(json.loads(line)["message"])
+                except (ValueError, KeyError):
+                    continue  # a line cut short by a crash
+    end = 0
+    for i, message in enumerate(messages):
+        if message.get("role") in ("system", "assistant") and not message.get("tool_calls"):
+            end = i + 1
+    return messages[:end]